@@ -1,9 +1,10 @@
 """FastAPI routes for PromptLab"""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.responses import JSONResponse  # Added import
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from datetime import datetime
+from typing import Literal, Optional
 
 from app.models import (
     Prompt, PromptCreate, PromptUpdate,
@@ -11,8 +12,7 @@ from app.models import (
     PromptList, CollectionList, HealthResponse,
     get_current_time
 )
-from app.storage import storage
-from app.utils import sort_prompts_by_date, filter_prompts_by_collection, search_prompts
+from app.storage import storage, PromptQuery
 from app import __version__
 
 
@@ -44,23 +44,41 @@ def health_check():
 @app.get("/prompts", response_model=PromptList)
 def list_prompts(
     collection_id: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sort: Literal["newest", "oldest"] = "newest",
+    limit: Optional[int] = Query(None, ge=1),
+    explain: bool = False
 ):
-    prompts = storage.get_all_prompts()
-    
-    # Filter by collection if specified
-    if collection_id:
-        prompts = filter_prompts_by_collection(prompts, collection_id)
-    
-    # Search if query provided
-    if search:
-        prompts = search_prompts(prompts, search)
-    
-    # Sort by date (newest first)
-    # Note: There might be an issue with the sorting...
-    prompts = sort_prompts_by_date(prompts, descending=True)
+    """List prompts matching the given filters.
+
+    Args:
+        collection_id: Only return prompts in this collection.
+        search: Case-insensitive text matched against title and description.
+        created_from: Only return prompts created at or after this time.
+        created_to: Only return prompts created before this time.
+        sort: "newest" (default) or "oldest" first by creation date.
+        limit: Maximum number of prompts to return.
+        explain: Include the executed query plan in the response.
+
+    Returns:
+        A PromptList with the matching prompts, plus the plan if requested.
+        When ``limit`` is given the scan stops once that many matches are
+        found, so ``total`` is the number of prompts returned, not the
+        number of prompts that match the filters.
+    """
+    query = PromptQuery(
+        collection_id=collection_id,
+        search=search,
+        created_from=created_from,
+        created_to=created_to,
+        descending=(sort == "newest"),
+        limit=limit
+    )
+    prompts, plan = storage.query_prompts(query)
     
-    return PromptList(prompts=prompts, total=len(prompts))
+    return PromptList(prompts=prompts, total=len(prompts), plan=plan if explain else None)
 
 
 @app.get("/prompts/{prompt_id}", response_model=Prompt, responses={404: {"content": {"application/json": {"example": {"error": "Prompt not available"}}}}})
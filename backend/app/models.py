@@ -64,9 +64,22 @@ class Collection(CollectionBase):
 
 # ============== Response Models ==============
 
+class QueryPlan(BaseModel):
+    access_path: str
+    shards_scanned: int
+    snapshot_scanned: bool
+    parallel: bool
+    filters: List[str]
+    sort: str
+    limit: Optional[int] = None
+    rows_scanned: int
+    rows_returned: int
+
+
 class PromptList(BaseModel):
     prompts: List[Prompt]
     total: int
+    plan: Optional[QueryPlan] = None
 
 
 class CollectionList(BaseModel):
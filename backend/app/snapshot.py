@@ -0,0 +1,396 @@
+"""Read-only binary snapshots of PromptLab storage
+
+A snapshot is a single file that can be memory-mapped at startup so a new
+worker can serve requests without first rebuilding every ``Prompt`` and
+``Collection``. Objects are only materialized when a request touches them,
+and because the file is mapped read-only its pages are shared between all
+worker processes through the OS page cache.
+
+File layout (all integers little-endian)::
+
+    header              magic, version, row counts, section offsets
+    prompt table        fixed-width rows, sorted by id
+    collection table    fixed-width rows, sorted by id
+    created order       u32 prompt row numbers sorted by created_at
+    collection index    fixed-width (collection_id, start, count) entries,
+                        sorted by collection_id
+    collection rows     u32 prompt row numbers, grouped per collection and
+                        sorted by created_at within each group
+    string heap         UTF-8 bytes referenced by (offset, length) pairs
+
+Datetimes are stored as microseconds since the Unix epoch and are read back
+as naive UTC datetimes, matching ``get_current_time``.
+"""
+
+import mmap
+import os
+import stat
+import struct
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from app.models import Prompt, Collection
+from app.utils import matches_search
+
+MAGIC = b"PLSNAP01"
+VERSION = 1
+
+# magic, version, prompt count, collection count, collection index count,
+# then offsets of: prompt table, collection table, created order,
+# collection index, collection rows, string heap
+_HEADER = struct.Struct("<8sIIII6Q")
+# A string reference: heap offset and byte length (NULL_LENGTH means None)
+_STR = "QI"
+NULL_LENGTH = 0xFFFFFFFF
+# id, title, content, description, collection_id, created_at, updated_at
+_PROMPT_ROW = struct.Struct("<" + _STR * 5 + "qq")
+# id, name, description, created_at
+_COLLECTION_ROW = struct.Struct("<" + _STR * 3 + "q")
+# collection_id, start, count
+_INDEX_ROW = struct.Struct("<" + _STR + "II")
+_U32 = struct.Struct("<I")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable PromptLab snapshot."""
+
+
+def _to_micros(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class _HeapWriter:
+    """Accumulates strings and hands back (offset, length) references."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._size = 0
+
+    def add(self, value: Optional[str]) -> Tuple[int, int]:
+        if value is None:
+            return 0, NULL_LENGTH
+        data = value.encode("utf-8")
+        ref = (self._size, len(data))
+        self._chunks.append(data)
+        self._size += len(data)
+        return ref
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+def write_snapshot(path: str, prompts: Iterable[Prompt],
+                   collections: Iterable[Collection]) -> None:
+    """Write prompts and collections to a snapshot file.
+
+    Args:
+        path: Destination file path. An existing file is atomically
+            replaced, so it is safe to save over a snapshot that is mapped.
+        prompts: The prompts to store.
+        collections: The collections to store.
+    """
+    prompts = sorted(prompts, key=lambda p: p.id)
+    collections = sorted(collections, key=lambda c: c.id)
+    heap = _HeapWriter()
+
+    prompt_rows = bytearray()
+    for p in prompts:
+        prompt_rows += _PROMPT_ROW.pack(
+            *heap.add(p.id), *heap.add(p.title), *heap.add(p.content),
+            *heap.add(p.description), *heap.add(p.collection_id),
+            _to_micros(p.created_at), _to_micros(p.updated_at),
+        )
+
+    collection_rows = bytearray()
+    for c in collections:
+        collection_rows += _COLLECTION_ROW.pack(
+            *heap.add(c.id), *heap.add(c.name), *heap.add(c.description),
+            _to_micros(c.created_at),
+        )
+
+    by_created = sorted(range(len(prompts)), key=lambda i: prompts[i].created_at)
+    created_order = b"".join(_U32.pack(i) for i in by_created)
+
+    groups = {}
+    for i in by_created:
+        if prompts[i].collection_id:
+            groups.setdefault(prompts[i].collection_id, []).append(i)
+    index_rows = bytearray()
+    member_rows = bytearray()
+    start = 0
+    for collection_id in sorted(groups):
+        members = groups[collection_id]
+        index_rows += _INDEX_ROW.pack(*heap.add(collection_id), start, len(members))
+        member_rows += b"".join(_U32.pack(i) for i in members)
+        start += len(members)
+
+    sections = [prompt_rows, collection_rows, created_order, index_rows, member_rows, heap.getvalue()]
+    offsets = []
+    position = _HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    # Write a sibling temp file and rename it over ``path`` so processes that
+    # still have the old snapshot mapped keep reading the old inode intact.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=".snapshot-"
+    )
+    try:
+        try:
+            f = os.fdopen(fd, "wb")
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            # mkstemp creates 0600 files; give the snapshot the permissions a
+            # plain open() would, so workers running as other users can read it
+            os.fchmod(f.fileno(), _snapshot_mode(path))
+            f.write(_HEADER.pack(
+                MAGIC, VERSION, len(prompts), len(collections), len(groups), *offsets
+            ))
+            for section in sections:
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _snapshot_mode(path: str) -> int:
+    """Keep an existing snapshot's mode, else use 0o666 minus the umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class Snapshot:
+    """A memory-mapped, read-only view of a snapshot file.
+
+    Opening a snapshot only validates the header; rows are decoded into
+    ``Prompt`` and ``Collection`` objects on access. Lookups by id use
+    binary search over the sorted tables and collection queries use the
+    pre-built collection index, so neither scans the whole file.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:
+                raise SnapshotError(f"{path} is empty") from exc
+        if len(self._mm) < _HEADER.size:
+            self.close()
+            raise SnapshotError(f"{path} is too small to be a snapshot")
+        (magic, version, self.prompt_count, self.collection_count,
+         self._index_count, self._prompt_table, self._collection_table,
+         self._created_order, self._collection_index, self._collection_rows,
+         self._heap) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError(f"{path} is not a version {VERSION} PromptLab snapshot")
+        try:
+            self._check_sections()
+        except SnapshotError as exc:
+            self.close()
+            raise SnapshotError(f"{path} is corrupt: {exc}") from None
+
+    def _check_sections(self) -> None:
+        """Check that every table fits in the file, so reads cannot overrun."""
+        offsets = [
+            self._prompt_table, self._collection_table, self._created_order,
+            self._collection_index, self._collection_rows, self._heap, len(self._mm),
+        ]
+        if offsets[0] < _HEADER.size or any(a > b for a, b in zip(offsets, offsets[1:])):
+            raise SnapshotError("section offsets are out of order or out of bounds")
+        sizes = [b - a for a, b in zip(offsets, offsets[1:])]
+        required = [
+            ("prompt table", self.prompt_count * _PROMPT_ROW.size),
+            ("collection table", self.collection_count * _COLLECTION_ROW.size),
+            ("created order", self.prompt_count * _U32.size),
+            ("collection index", self._index_count * _INDEX_ROW.size),
+        ]
+        for (name, needed), size in zip(required, sizes):
+            if size < needed:
+                raise SnapshotError(f"{name} is truncated")
+        member_count = sizes[4] // _U32.size
+        for i in range(self._index_count):
+            start, count = _INDEX_ROW.unpack_from(
+                self._mm, self._collection_index + i * _INDEX_ROW.size
+            )[2:4]
+            if start + count > member_count:
+                raise SnapshotError("collection rows are truncated")
+
+    def close(self) -> None:
+        self._mm.close()
+
+    # ============== Decoding ==============
+
+    def _str(self, offset: int, length: int) -> Optional[str]:
+        if length == NULL_LENGTH:
+            return None
+        start = self._heap + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _u32(self, base: int, i: int) -> int:
+        return _U32.unpack_from(self._mm, base + i * _U32.size)[0]
+
+    def _prompt_fields(self, row: int) -> tuple:
+        return _PROMPT_ROW.unpack_from(self._mm, self._prompt_table + row * _PROMPT_ROW.size)
+
+    def _prompt_id(self, row: int) -> str:
+        return self._str(*self._prompt_fields(row)[0:2])
+
+    def _prompt_matches(self, row: int, query_lower: str) -> bool:
+        fields = self._prompt_fields(row)
+        return matches_search(self._str(*fields[2:4]), self._str(*fields[6:8]), query_lower)
+
+    def _materialize_prompt(self, row: int) -> Prompt:
+        f = self._prompt_fields(row)
+        # Rows were validated when they were written, so skip validation
+        return Prompt.model_construct(
+            id=self._str(f[0], f[1]),
+            title=self._str(f[2], f[3]),
+            content=self._str(f[4], f[5]),
+            description=self._str(f[6], f[7]),
+            collection_id=self._str(f[8], f[9]),
+            created_at=_from_micros(f[10]),
+            updated_at=_from_micros(f[11]),
+        )
+
+    def _collection_fields(self, row: int) -> tuple:
+        return _COLLECTION_ROW.unpack_from(
+            self._mm, self._collection_table + row * _COLLECTION_ROW.size
+        )
+
+    def _materialize_collection(self, row: int) -> Collection:
+        f = self._collection_fields(row)
+        return Collection.model_construct(
+            id=self._str(f[0], f[1]),
+            name=self._str(f[2], f[3]),
+            description=self._str(f[4], f[5]),
+            created_at=_from_micros(f[6]),
+        )
+
+    @staticmethod
+    def _lower_bound(lo: int, hi: int, key_at: Callable[[int], Any], key: Any) -> int:
+        """Return the first position in ``[lo, hi)`` whose key is >= ``key``."""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect(self, count: int, key_at: Callable[[int], str], key: str) -> Optional[int]:
+        position = self._lower_bound(0, count, key_at, key)
+        if position < count and key_at(position) == key:
+            return position
+        return None
+
+    # ============== Lookups ==============
+
+    def get_prompt(self, prompt_id: str) -> Optional[Prompt]:
+        row = self._bisect(self.prompt_count, self._prompt_id, prompt_id)
+        return None if row is None else self._materialize_prompt(row)
+
+    def get_collection(self, collection_id: str) -> Optional[Collection]:
+        row = self._bisect(
+            self.collection_count,
+            lambda i: self._str(*self._collection_fields(i)[0:2]),
+            collection_id,
+        )
+        return None if row is None else self._materialize_collection(row)
+
+    def has_collection(self, collection_id: str) -> bool:
+        return self.get_collection(collection_id) is not None
+
+    def _collection_range(self, collection_id: str) -> Tuple[int, int]:
+        def key_at(i: int) -> str:
+            fields = _INDEX_ROW.unpack_from(self._mm, self._collection_index + i * _INDEX_ROW.size)
+            return self._str(fields[0], fields[1])
+
+        entry = self._bisect(self._index_count, key_at, collection_id)
+        if entry is None:
+            return 0, 0
+        fields = _INDEX_ROW.unpack_from(self._mm, self._collection_index + entry * _INDEX_ROW.size)
+        return fields[2], fields[3]
+
+    def iter_prompts(
+        self,
+        collection_id: Optional[str] = None,
+        search: Optional[str] = None,
+        descending: bool = True,
+        exclude: Optional[Callable[[str], bool]] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        on_scan: Optional[Callable[[], Any]] = None,
+    ) -> Iterator[Prompt]:
+        """Yield matching prompts lazily in ``created_at`` order.
+
+        Rows are read from the collection index when ``collection_id`` is
+        given and from the created order index otherwise; either way the
+        date range is located by binary search. Search terms are matched
+        against the raw strings, so only prompts that are actually yielded
+        get materialized.
+
+        Args:
+            collection_id: Only yield prompts in this collection.
+            search: Case-insensitive substring matched against title and
+                description.
+            descending: Newest first if True, oldest first otherwise.
+            exclude: Optional predicate; prompt ids for which it returns
+                True are skipped.
+            created_from: Only yield prompts created at or after this time.
+            created_to: Only yield prompts created before this time.
+            on_scan: Optional callback invoked once per index row read.
+
+        Yields:
+            Prompt objects in ``created_at`` order.
+        """
+        if collection_id:
+            start, count = self._collection_range(collection_id)
+            base = self._collection_rows
+        else:
+            start, count = 0, self.prompt_count
+            base = self._created_order
+        lo, hi = start, start + count
+
+        def created_at(position: int) -> int:
+            return self._prompt_fields(self._u32(base, position))[10]
+
+        if created_from is not None:
+            lo = self._lower_bound(lo, hi, created_at, _to_micros(created_from))
+        if created_to is not None:
+            hi = self._lower_bound(lo, hi, created_at, _to_micros(created_to))
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        query_lower = search.lower() if search else None
+        for position in positions:
+            if on_scan is not None:
+                on_scan()
+            row = self._u32(base, position)
+            if exclude is not None and exclude(self._prompt_id(row)):
+                continue
+            if query_lower and not self._prompt_matches(row, query_lower):
+                continue
+            yield self._materialize_prompt(row)
+
+    def iter_collections(self) -> Iterator[Collection]:
+        for row in range(self.collection_count):
+            yield self._materialize_collection(row)
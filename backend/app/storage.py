@@ -2,68 +2,552 @@
 
 This module provides simple in-memory storage for prompts and collections.
 In a production environment, this would be replaced with a database.
+
+Data is partitioned into independent shards so that large libraries do not
+pay for whole-library scans on every request. A collection and all of its
+prompts live in the same shard (chosen by a stable hash of the collection
+id); prompts without a collection are placed by a hash of their own id.
+Each shard keeps its own collection index and lock, so single-collection
+queries only ever touch one shard.
+
+A read-only snapshot (see ``app.snapshot``) can be attached as a base layer
+so a freshly started worker serves the saved library without rebuilding it.
 """
 
-from typing import Dict, List, Optional
-from app.models import Prompt, Collection
+import bisect
+import heapq
+import itertools
+import operator
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
+from app.models import Prompt, Collection, QueryPlan
+from app.snapshot import Snapshot, write_snapshot
+from app.utils import matches_search
+
+DEFAULT_NUM_SHARDS = 8
+# Number of locks guarding prompt locations, picked by a hash of the prompt id
+LOCATION_LOCK_STRIPES = 64
+
+
+# One pool shared by every Storage instance, created on first use; shards
+# beyond its size simply queue behind the others.
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _scatter_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DEFAULT_NUM_SHARDS, thread_name_prefix="storage-shard"
+            )
+        return _executor
+
+
+def shard_for_key(key: str, num_shards: int) -> int:
+    """Map a key to a shard index.
+
+    Uses CRC32 rather than ``hash()`` so placement is stable across
+    processes and interpreter restarts.
+
+    Args:
+        key: The collection or prompt id used for placement.
+        num_shards: Total number of shards.
+
+    Returns:
+        The shard index in ``range(num_shards)``.
+    """
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+
+# Index entries read per lock acquisition when a scan may stop early
+SCAN_CHUNK_SIZE = 256
+
+# (created_at, prompt_id, prompt) entries kept sorted, so date order and date
+# ranges come straight from the index and ties break deterministically by id.
+# Ids are unique within an index, so comparisons never reach the Prompt.
+IndexEntry = Tuple[datetime, str, Prompt]
+
+
+class _Shard:
+    """A single partition of the store with its own indexes and lock."""
 
-class Storage:
     def __init__(self):
-        self._prompts: Dict[str, Prompt] = {}
-        self._collections: Dict[str, Collection] = {}
-    
+        self.lock = threading.RLock()
+        self.prompts: Dict[str, Prompt] = {}
+        self.collections: Dict[str, Collection] = {}
+        self.by_created: List[IndexEntry] = []
+        # collection_id -> sorted index of that collection's prompts
+        self.by_collection: Dict[str, List[IndexEntry]] = {}
+
+    def add_prompt(self, prompt: Prompt) -> None:
+        entry = (prompt.created_at, prompt.id, prompt)
+        self.prompts[prompt.id] = prompt
+        bisect.insort(self.by_created, entry)
+        if prompt.collection_id:
+            bisect.insort(self.by_collection.setdefault(prompt.collection_id, []), entry)
+
+    def remove_prompt(self, prompt_id: str) -> Optional[Prompt]:
+        prompt = self.prompts.pop(prompt_id, None)
+        if prompt is not None:
+            self.unindex(prompt)
+        return prompt
+
+    def unindex(self, prompt: Prompt) -> None:
+        """Drop a prompt's index entries without touching ``prompts``."""
+        key = (prompt.created_at, prompt.id)
+        _remove_entry(self.by_created, key)
+        if prompt.collection_id:
+            members = self.by_collection.get(prompt.collection_id)
+            if members is not None:
+                _remove_entry(members, key)
+                if not members:
+                    del self.by_collection[prompt.collection_id]
+
+    def collection_prompts(self, collection_id: str) -> List[Prompt]:
+        with self.lock:
+            return [entry[2] for entry in self.by_collection.get(collection_id, [])]
+
+    def chunks(self, query: "PromptQuery",
+               chunk_size: Optional[int]) -> Iterator[List[IndexEntry]]:
+        """Yield the query's index window in ``created_at`` order, in chunks.
+
+        The collection index is used when the query names a collection and
+        the created order index otherwise; the date range is located by
+        binary search, so only entries inside it are ever read. Each chunk
+        is sliced under the lock, and the next one resumes just past the
+        last entry seen, so concurrent inserts and removals cannot make a
+        scan skip or repeat entries. A ``chunk_size`` of None reads the
+        whole window in one locked copy.
+        """
+        last: Optional[Tuple[datetime, str]] = None
+        while True:
+            with self.lock:
+                if query.collection_id:
+                    index = self.by_collection.get(query.collection_id, [])
+                else:
+                    index = self.by_created
+                lo = 0 if query.created_from is None else bisect.bisect_left(index, (query.created_from,))
+                hi = len(index) if query.created_to is None else bisect.bisect_left(index, (query.created_to,))
+                if last is not None:
+                    position = bisect.bisect_left(index, last)
+                    if query.descending:
+                        hi = min(hi, position)
+                    else:
+                        if position < len(index) and index[position][:2] == last:
+                            position += 1
+                        lo = max(lo, position)
+                if chunk_size is not None:
+                    if query.descending:
+                        lo = max(lo, hi - chunk_size)
+                    else:
+                        hi = min(hi, lo + chunk_size)
+                chunk = index[lo:hi]
+            if not chunk:
+                return
+            if query.descending:
+                chunk.reverse()
+            yield chunk
+            if chunk_size is None:
+                return
+            last = chunk[-1][:2]
+
+    def collect(self, query: "PromptQuery") -> Tuple[List[IndexEntry], int]:
+        """Return this shard's first ``query.limit`` matches and rows read.
+
+        Without a residual filter exactly ``limit`` entries are read; with
+        one, entries are read in chunks until enough of them match.
+        """
+        limit = query.limit
+        if limit is None:
+            chunk_size = None
+        elif query.has_residual_filter:
+            chunk_size = SCAN_CHUNK_SIZE
+        else:
+            chunk_size = limit
+        matched: List[IndexEntry] = []
+        scanned = 0
+        for chunk in self.chunks(query, chunk_size):
+            scanned += len(chunk)
+            if query.has_residual_filter:
+                chunk = [entry for entry in chunk if query.matches(entry[2])]
+            matched.extend(chunk)
+            if limit is not None and len(matched) >= limit:
+                del matched[limit:]
+                break
+        return matched, scanned
+
+    def clear(self) -> None:
+        with self.lock:
+            self.prompts.clear()
+            self.collections.clear()
+            self.by_created.clear()
+            self.by_collection.clear()
+
+
+def _remove_entry(index: List[IndexEntry], key: Tuple[datetime, str]) -> None:
+    position = bisect.bisect_left(index, key)
+    if position < len(index) and index[position][:2] == key:
+        del index[position]
+
+
+@dataclass
+class PromptQuery:
+    """A combined prompt filter for ``Storage.query_prompts``.
+
+    Attributes:
+        collection_id: Only match prompts in this collection.
+        search: Case-insensitive substring matched against title and
+            description.
+        created_from: Only match prompts created at or after this time.
+        created_to: Only match prompts created before this time.
+        descending: Newest first if True, oldest first otherwise.
+        limit: Stop after this many matches; None returns all of them.
+    """
+
+    collection_id: Optional[str] = None
+    search: Optional[str] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    descending: bool = True
+    limit: Optional[int] = None
+
+    def __post_init__(self):
+        # Stored timestamps are naive UTC; normalize aware bounds to match
+        self.created_from = _naive_utc(self.created_from)
+        self.created_to = _naive_utc(self.created_to)
+        self._search_lower = self.search.lower() if self.search else None
+
+    @property
+    def has_residual_filter(self) -> bool:
+        """Whether rows must be checked beyond what the index guarantees."""
+        return self._search_lower is not None
+
+    def matches(self, prompt: Prompt) -> bool:
+        """Apply the filters the access path does not already guarantee."""
+        return self._search_lower is None or matches_search(
+            prompt.title, prompt.description, self._search_lower
+        )
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class Storage:
+    def __init__(self, num_shards: int = DEFAULT_NUM_SHARDS):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self._shards: List[_Shard] = [_Shard() for _ in range(num_shards)]
+        # prompt_id -> shard index, so id lookups never scan shards. Single
+        # dict operations are atomic; the striped locks only serialize writes
+        # to the same prompt, so writers to different shards run concurrently.
+        self._prompt_locations: Dict[str, int] = {}
+        self._location_locks = [threading.Lock() for _ in range(LOCATION_LOCK_STRIPES)]
+        # Optional read-only base layer; the shards hold everything written
+        # since it was attached, and the hidden sets mask snapshot rows
+        # that were updated or deleted.
+        self._snapshot: Optional[Snapshot] = None
+        self._hidden_prompts: Set[str] = set()
+        self._hidden_collections: Set[str] = set()
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._shards)
+
+    def _shard_index_for(self, prompt: Prompt) -> int:
+        return shard_for_key(prompt.collection_id or prompt.id, self.num_shards)
+
+    def _location_lock(self, prompt_id: str) -> threading.Lock:
+        return self._location_locks[shard_for_key(prompt_id, LOCATION_LOCK_STRIPES)]
+
+    def _collection_shard(self, collection_id: str) -> _Shard:
+        return self._shards[shard_for_key(collection_id, self.num_shards)]
+
+    def _scatter(self, fn) -> List:
+        """Run ``fn(shard)`` on every shard, in parallel when sharded."""
+        if self.num_shards == 1:
+            return [fn(self._shards[0])]
+        return list(_scatter_executor().map(fn, self._shards))
+
+    # ============== Snapshot Operations ==============
+
+    def attach_snapshot(self, path: str) -> None:
+        """Serve a memory-mapped snapshot as the read-only base layer.
+
+        Existing contents are discarded. Rows are materialized lazily on
+        access; later writes go to the shards and shadow snapshot rows.
+
+        Args:
+            path: Path to a file written by ``save_snapshot``.
+
+        Raises:
+            SnapshotError: If the file is not a valid snapshot.
+        """
+        self._reset(Snapshot(path))
+
+    def save_snapshot(self, path: str) -> None:
+        """Write the current contents to a snapshot file.
+
+        Args:
+            path: Destination file path.
+        """
+        write_snapshot(path, self.get_all_prompts(), self.get_all_collections())
+
+    def _snapshot_prompt(self, prompt_id: str) -> Optional[Prompt]:
+        snapshot = self._snapshot
+        if snapshot is None or prompt_id in self._hidden_prompts:
+            return None
+        return snapshot.get_prompt(prompt_id)
+
     # ============== Prompt Operations ==============
-    
+
     def create_prompt(self, prompt: Prompt) -> Prompt:
-        self._prompts[prompt.id] = prompt
+        index = self._shard_index_for(prompt)
+        shard = self._shards[index]
+        with self._location_lock(prompt.id), shard.lock:
+            self._prompt_locations[prompt.id] = index
+            shard.add_prompt(prompt)
         return prompt
-    
+
     def get_prompt(self, prompt_id: str) -> Optional[Prompt]:
-        return self._prompts.get(prompt_id)
-    
+        index = self._prompt_locations.get(prompt_id)
+        if index is None:
+            return self._snapshot_prompt(prompt_id)
+        prompt = self._shards[index].prompts.get(prompt_id)
+        if prompt is None:
+            # A concurrent update may have moved it after we read its location
+            moved_to = self._prompt_locations.get(prompt_id)
+            if moved_to is not None and moved_to != index:
+                prompt = self._shards[moved_to].prompts.get(prompt_id)
+        return prompt
+
     def get_all_prompts(self) -> List[Prompt]:
-        return list(self._prompts.values())
-    
+        snapshot = self._snapshot
+        prompts = [p for shard in self._shards for p in list(shard.prompts.values())]
+        if snapshot is not None:
+            prompts.extend(snapshot.iter_prompts(
+                descending=False, exclude=self._hidden_prompts.__contains__
+            ))
+        return prompts
+
+    def list_prompts(
+        self,
+        collection_id: Optional[str] = None,
+        search: Optional[str] = None,
+        descending: bool = True,
+    ) -> List[Prompt]:
+        """List prompts sorted by creation date.
+
+        Args:
+            collection_id: Only return prompts in this collection.
+            search: Case-insensitive substring matched against title and
+                description.
+            descending: Newest first if True, oldest first otherwise.
+
+        Returns:
+            The matching prompts in ``created_at`` order.
+        """
+        query = PromptQuery(collection_id=collection_id, search=search, descending=descending)
+        return self.query_prompts(query)[0]
+
+    def query_prompts(self, query: PromptQuery) -> Tuple[List[Prompt], QueryPlan]:
+        """Run a combined prompt query and report how it was executed.
+
+        The most selective index is chosen as the access path: a named
+        collection reads only that collection's index in its own shard,
+        and a date range is located by binary search in the created order
+        index. Each shard (and any attached snapshot) reads that window in
+        order, applies the remaining filters and stops once it has ``limit``
+        matches; the ordered partials are then merged by ``created_at``.
+        Unlimited or filtered queries may read every row, so they scan the
+        shards in parallel; an unfiltered limit reads at most ``limit``
+        entries per shard and runs inline.
+
+        Args:
+            query: The filters, sort order and limit to apply.
+
+        Returns:
+            A tuple of the matching prompts and the executed ``QueryPlan``.
+        """
+        if query.collection_id:
+            shards = [self._collection_shard(query.collection_id)]
+            access_path = "collection_index"
+        else:
+            shards = self._shards
+            access_path = "created_at_index"
+        if query.created_from is not None or query.created_to is not None:
+            access_path += "_range"
+        # Unlimited and filtered queries may read every row, so spread the
+        # shards across threads; an unfiltered limit reads only `limit` rows
+        # per shard, which is cheaper to do inline.
+        parallel = len(shards) > 1 and (query.limit is None or query.has_residual_filter)
+        if parallel:
+            results = self._scatter(lambda shard: shard.collect(query))
+        else:
+            results = [shard.collect(query) for shard in shards]
+        entries = list(itertools.chain.from_iterable(matched for matched, _ in results))
+        rows_scanned = sum(scanned for _, scanned in results)
+
+        snapshot = self._snapshot
+        if snapshot is not None:
+            counter = itertools.count()
+            rows = snapshot.iter_prompts(
+                query.collection_id, query.search, query.descending,
+                exclude=self._hidden_prompts.__contains__,
+                created_from=query.created_from, created_to=query.created_to,
+                on_scan=counter.__next__,
+            )
+            entries.extend((p.created_at, p.id, p) for p in itertools.islice(rows, query.limit))
+            rows_scanned += next(counter)
+
+        # Each partial is already ordered, so this sort just merges the runs
+        if len(results) > 1 or snapshot is not None:
+            entries.sort(key=operator.itemgetter(0, 1), reverse=query.descending)
+        prompts = [entry[2] for entry in entries[:query.limit]]
+
+        plan = QueryPlan(
+            access_path=access_path,
+            shards_scanned=len(shards),
+            snapshot_scanned=snapshot is not None,
+            parallel=parallel,
+            filters=["search"] if query.search else [],
+            sort="newest" if query.descending else "oldest",
+            limit=query.limit,
+            rows_scanned=rows_scanned,
+            rows_returned=len(prompts),
+        )
+        return prompts, plan
+
     def update_prompt(self, prompt_id: str, prompt: Prompt) -> Optional[Prompt]:
-        if prompt_id not in self._prompts:
-            return None
-        self._prompts[prompt_id] = prompt
+        with self._location_lock(prompt_id):
+            old_index = self._prompt_locations.get(prompt_id)
+            new_index = self._shard_index_for(prompt)
+            if old_index is None and self._snapshot_prompt(prompt_id) is None:
+                return None
+            with ExitStack() as stack:
+                # Lock shards in index order so concurrent moves cannot deadlock
+                for index in sorted({old_index, new_index} - {None}):
+                    stack.enter_context(self._shards[index].lock)
+                previous = None
+                if old_index is not None:
+                    previous = self._shards[old_index].prompts.get(prompt_id)
+                if previous is not None and old_index == new_index:
+                    # Same shard: drop the old index entries first so the
+                    # index never holds two entries for one prompt
+                    self._shards[old_index].unindex(previous)
+                    previous = None
+                # Publish the new copy and its location before retiring the
+                # old one, so lock-free readers never find the prompt missing
+                self._shards[new_index].add_prompt(prompt)
+                self._prompt_locations[prompt_id] = new_index
+                if previous is not None:
+                    self._shards[old_index].unindex(previous)
+                    del self._shards[old_index].prompts[prompt_id]
+            if old_index is None:
+                # First write to a snapshot row: it now lives in the shards
+                self._hidden_prompts.add(prompt_id)
         return prompt
-    
+
     def delete_prompt(self, prompt_id: str) -> bool:
-        if prompt_id in self._prompts:
-            del self._prompts[prompt_id]
-            return True
-        return False
-    
+        with self._location_lock(prompt_id):
+            index = self._prompt_locations.pop(prompt_id, None)
+            if index is None:
+                if self._snapshot_prompt(prompt_id) is None:
+                    return False
+                self._hidden_prompts.add(prompt_id)
+                return True
+            shard = self._shards[index]
+            with shard.lock:
+                shard.remove_prompt(prompt_id)
+        return True
+
     # ============== Collection Operations ==============
-    
+
     def create_collection(self, collection: Collection) -> Collection:
-        self._collections[collection.id] = collection
+        shard = self._collection_shard(collection.id)
+        with shard.lock:
+            shard.collections[collection.id] = collection
         return collection
-    
+
     def get_collection(self, collection_id: str) -> Optional[Collection]:
-        return self._collections.get(collection_id)
-    
+        snapshot = self._snapshot
+        collection = self._collection_shard(collection_id).collections.get(collection_id)
+        if collection is None and snapshot is not None \
+                and collection_id not in self._hidden_collections:
+            collection = snapshot.get_collection(collection_id)
+        return collection
+
     def get_all_collections(self) -> List[Collection]:
-        return list(self._collections.values())
-    
+        # Collections are few, so a thread handoff would cost more than the sort
+        partials = [
+            sorted(list(shard.collections.values()), key=lambda c: c.created_at)
+            for shard in self._shards
+        ]
+        snapshot = self._snapshot
+        if snapshot is not None:
+            partials.append(sorted(
+                (c for c in snapshot.iter_collections()
+                 if c.id not in self._hidden_collections),
+                key=lambda c: c.created_at,
+            ))
+        return list(heapq.merge(*partials, key=lambda c: c.created_at))
+
     def delete_collection(self, collection_id: str) -> bool:
-        if collection_id in self._collections:
-            del self._collections[collection_id]
+        shard = self._collection_shard(collection_id)
+        with shard.lock:
+            if collection_id in shard.collections:
+                del shard.collections[collection_id]
+                return True
+        snapshot = self._snapshot
+        if snapshot is not None and collection_id not in self._hidden_collections \
+                and snapshot.has_collection(collection_id):
+            self._hidden_collections.add(collection_id)
             return True
         return False
-    
+
     def get_prompts_by_collection(self, collection_id: str) -> List[Prompt]:
-        return [p for p in self._prompts.values() if p.collection_id == collection_id]
-    
+        snapshot = self._snapshot
+        prompts = self._collection_shard(collection_id).collection_prompts(collection_id)
+        if snapshot is not None:
+            prompts.extend(snapshot.iter_prompts(
+                collection_id, exclude=self._hidden_prompts.__contains__
+            ))
+        return prompts
+
     # ============== Utility ==============
-    
+
     def clear(self):
-        self._prompts.clear()
-        self._collections.clear()
+        self._reset(None)
+
+    def _reset(self, snapshot: Optional[Snapshot]) -> None:
+        # In-flight readers may still hold the previous snapshot, so it is
+        # dropped rather than closed; its mapping is released once they finish.
+        with ExitStack() as stack:
+            for lock in self._location_locks:
+                stack.enter_context(lock)
+            self._prompt_locations.clear()
+            for shard in self._shards:
+                shard.clear()
+            self._hidden_prompts = set()
+            self._hidden_collections = set()
+            self._snapshot = snapshot
 
 
 # Global storage instance
 storage = Storage()
+
+# Workers started with PROMPTLAB_SNAPSHOT set map the same file read-only,
+# so its pages are shared between processes instead of copied into each.
+if os.environ.get("PROMPTLAB_SNAPSHOT"):
+    storage.attach_snapshot(os.environ["PROMPTLAB_SNAPSHOT"])
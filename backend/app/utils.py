@@ -1,6 +1,6 @@
 """Utility functions for PromptLab"""
 
-from typing import List
+from typing import List, Optional
 from app.models import Prompt
 
 
@@ -17,13 +17,16 @@ def filter_prompts_by_collection(prompts: List[Prompt], collection_id: str) -> L
     return [p for p in prompts if p.collection_id == collection_id]
 
 
+def matches_search(title: str, description: Optional[str], query_lower: str) -> bool:
+    """Check whether a title or description contains a lowercased query."""
+    return query_lower in title.lower() or (
+        description is not None and query_lower in description.lower()
+    )
+
+
 def search_prompts(prompts: List[Prompt], query: str) -> List[Prompt]:
     query_lower = query.lower()
-    return [
-        p for p in prompts 
-        if query_lower in p.title.lower() or 
-           (p.description and query_lower in p.description.lower())
-    ]
+    return [p for p in prompts if matches_search(p.title, p.description, query_lower)]
 
 
 def validate_prompt_content(content: str) -> bool:
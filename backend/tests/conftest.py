@@ -1,11 +1,25 @@
 """Test fixtures for PromptLab"""
 
+from datetime import datetime, timedelta
+
 import pytest
 from fastapi.testclient import TestClient
 from app.api import app
+from app.models import Prompt
 from app.storage import storage
 
 
+def make_prompt(title: str, minutes: int, collection_id=None, description=None) -> Prompt:
+    """Build a prompt created ``minutes`` after a fixed reference time."""
+    return Prompt(
+        title=title,
+        content=f"{title} content",
+        description=description,
+        collection_id=collection_id,
+        created_at=datetime(2024, 1, 1) + timedelta(minutes=minutes),
+    )
+
+
 @pytest.fixture
 def client():
     """Create a test client for the API."""
@@ -128,6 +128,50 @@ class TestPrompts:
         # Newest (Second) should be first
         assert prompts[0]["title"] == "Second"  # Will fail until Bug #3 fixed
 
+    def test_list_prompts_sort_and_limit(self, client: TestClient):
+        for title in ["First", "Second", "Third"]:
+            client.post("/prompts", json={"title": title, "content": f"{title} content"})
+        
+        response = client.get("/prompts", params={"sort": "oldest", "limit": 2})
+        assert response.status_code == 200
+        data = response.json()
+        assert [p["title"] for p in data["prompts"]] == ["First", "Second"]
+        # With a limit, total counts the returned page rather than all matches
+        assert data["total"] == 2
+        assert data["plan"] is None
+    
+    def test_list_prompts_invalid_limit(self, client: TestClient):
+        response = client.get("/prompts", params={"limit": 0})
+        assert response.status_code == 422
+    
+    def test_list_prompts_explain(self, client: TestClient, sample_collection_data, sample_prompt_data):
+        collection_id = client.post("/collections", json=sample_collection_data).json()["id"]
+        client.post("/prompts", json={**sample_prompt_data, "collection_id": collection_id})
+        client.post("/prompts", json=sample_prompt_data)
+        
+        response = client.get("/prompts", params={
+            "collection_id": collection_id,
+            "search": "review",
+            "explain": True
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        plan = data["plan"]
+        assert plan["access_path"] == "collection_index"
+        assert plan["shards_scanned"] == 1
+        assert plan["filters"] == ["search"]
+        assert plan["rows_scanned"] == 1
+        assert plan["rows_returned"] == 1
+    
+    def test_list_prompts_date_range(self, client: TestClient, sample_prompt_data):
+        created_at = client.post("/prompts", json=sample_prompt_data).json()["created_at"]
+        
+        response = client.get("/prompts", params={"created_from": created_at})
+        assert response.json()["total"] == 1
+        response = client.get("/prompts", params={"created_to": created_at})
+        assert response.json()["total"] == 0
+
     def test_patch_prompt_partial_update(self, client: TestClient, sample_prompt_data):
         """Test partially updating a prompt with PATCH request.
         
@@ -0,0 +1,178 @@
+"""Snapshot tests for PromptLab
+
+These tests verify the memory-mapped snapshot format and how storage serves it.
+"""
+
+import os
+import stat
+from datetime import datetime
+
+import pytest
+
+from app.models import Collection
+from app.snapshot import Snapshot, SnapshotError, write_snapshot
+from app.storage import PromptQuery, Storage
+from tests.conftest import make_prompt
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Write a small library to a snapshot file and return its path."""
+    store = Storage(num_shards=4)
+    dev = store.create_collection(Collection(name="Dev", description="Dev prompts"))
+    store.create_collection(Collection(name="Empty"))
+    store.create_prompt(make_prompt("Review", 3, collection_id=dev.id, description="code review"))
+    store.create_prompt(make_prompt("Refactor", 1, collection_id=dev.id))
+    store.create_prompt(make_prompt("Poem", 2, description="ünïcode verse"))
+    path = str(tmp_path / "library.snap")
+    store.save_snapshot(path)
+    return path
+
+
+class TestSnapshotFormat:
+    """Tests for reading the binary format directly."""
+
+    def test_round_trip(self, snapshot_path):
+        snapshot = Snapshot(snapshot_path)
+        assert snapshot.prompt_count == 3
+        assert snapshot.collection_count == 2
+
+        prompts = list(snapshot.iter_prompts(descending=False))
+        assert [p.title for p in prompts] == ["Refactor", "Poem", "Review"]
+        assert prompts[1].description == "ünïcode verse"
+        assert prompts[1].collection_id is None
+        assert prompts[0].created_at == datetime(2024, 1, 1, 0, 1)
+
+        assert snapshot.get_prompt(prompts[2].id) == prompts[2]
+        assert snapshot.get_prompt("missing") is None
+        snapshot.close()
+
+    def test_collection_index(self, snapshot_path):
+        snapshot = Snapshot(snapshot_path)
+        dev = next(c for c in snapshot.iter_collections() if c.name == "Dev")
+        assert snapshot.get_collection(dev.id) == dev
+        titles = [p.title for p in snapshot.iter_prompts(collection_id=dev.id)]
+        assert titles == ["Review", "Refactor"]
+        assert list(snapshot.iter_prompts(collection_id="missing")) == []
+        snapshot.close()
+
+    def test_search(self, snapshot_path):
+        snapshot = Snapshot(snapshot_path)
+        titles = [p.title for p in snapshot.iter_prompts(search="CODE")]
+        assert titles == ["Review", "Poem"]
+        snapshot.close()
+
+    def test_date_range(self, snapshot_path):
+        snapshot = Snapshot(snapshot_path)
+        scanned = []
+        prompts = snapshot.iter_prompts(
+            created_from=datetime(2024, 1, 1, 0, 2),
+            created_to=datetime(2024, 1, 1, 0, 3),
+            on_scan=lambda: scanned.append(1),
+        )
+        assert [p.title for p in prompts] == ["Poem"]
+        assert len(scanned) == 1
+        snapshot.close()
+
+    def test_file_mode(self, tmp_path):
+        path = str(tmp_path / "fresh.snap")
+        umask = os.umask(0o022)
+        try:
+            write_snapshot(path, [], [])
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+        os.chmod(path, 0o640)
+        write_snapshot(path, [], [])
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+    def test_rejects_invalid_file(self, tmp_path):
+        path = tmp_path / "bad.snap"
+        path.write_bytes(b"not a snapshot" * 10)
+        with pytest.raises(SnapshotError):
+            Snapshot(str(path))
+
+
+    @pytest.mark.parametrize("size", [80, 200, 400])
+    def test_rejects_truncated_file(self, snapshot_path, size):
+        with open(snapshot_path, "rb") as f:
+            data = f.read()
+        with open(snapshot_path, "wb") as f:
+            f.write(data[:size])
+        with pytest.raises(SnapshotError):
+            Snapshot(snapshot_path)
+
+
+class TestSnapshotStorage:
+    """Tests for storage backed by an attached snapshot."""
+
+    def test_reads_from_snapshot(self, snapshot_path):
+        store = Storage(num_shards=4)
+        store.attach_snapshot(snapshot_path)
+
+        assert [p.title for p in store.list_prompts()] == ["Review", "Poem", "Refactor"]
+        assert len(store.get_all_prompts()) == 3
+        assert len(store.get_all_collections()) == 2
+
+    def test_writes_shadow_snapshot_rows(self, snapshot_path):
+        store = Storage(num_shards=4)
+        store.attach_snapshot(snapshot_path)
+        review, poem, refactor = store.list_prompts()
+        dev_id = review.collection_id
+
+        store.update_prompt(review.id, review.model_copy(update={"title": "Review v2"}))
+        assert store.delete_prompt(poem.id)
+        assert not store.delete_prompt(poem.id)
+        store.create_prompt(make_prompt("New", 9, collection_id=dev_id))
+
+        assert store.get_prompt(review.id).title == "Review v2"
+        assert store.get_prompt(poem.id) is None
+        assert [p.title for p in store.list_prompts()] == ["New", "Review v2", "Refactor"]
+        assert [p.title for p in store.list_prompts(collection_id=dev_id)] == [
+            "New", "Review v2", "Refactor"
+        ]
+
+        assert store.delete_collection(dev_id)
+        assert store.get_collection(dev_id) is None
+        assert not store.delete_collection(dev_id)
+
+    def test_query_merges_snapshot_and_shards(self, snapshot_path):
+        store = Storage(num_shards=4)
+        store.attach_snapshot(snapshot_path)
+        store.create_prompt(make_prompt("New", 9))
+
+        prompts, plan = store.query_prompts(PromptQuery(limit=2))
+        assert [p.title for p in prompts] == ["New", "Review"]
+        assert plan.snapshot_scanned
+
+    def test_save_over_attached_snapshot(self, snapshot_path):
+        store = Storage(num_shards=4)
+        store.attach_snapshot(snapshot_path)
+        store.create_prompt(make_prompt("New", 9))
+        store.save_snapshot(snapshot_path)
+
+        # The existing mapping still sees the old file
+        assert [p.title for p in store.list_prompts()] == ["New", "Review", "Poem", "Refactor"]
+
+        reloaded = Storage(num_shards=4)
+        reloaded.attach_snapshot(snapshot_path)
+        assert [p.title for p in reloaded.list_prompts()] == ["New", "Review", "Poem", "Refactor"]
+
+    def test_clear_detaches_snapshot(self, snapshot_path):
+        store = Storage()
+        store.attach_snapshot(snapshot_path)
+        store.clear()
+        assert store.list_prompts() == []
+        assert store.get_all_collections() == []
+
+    def test_clear_leaves_in_flight_reads_working(self, snapshot_path):
+        store = Storage()
+        store.attach_snapshot(snapshot_path)
+        snapshot = store._snapshot
+        rows = snapshot.iter_prompts()
+        assert next(rows).title == "Review"
+
+        store.attach_snapshot(snapshot_path)
+        store.clear()
+        assert [p.title for p in rows] == ["Poem", "Refactor"]